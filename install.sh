@@ -47,7 +47,7 @@ source venv/bin/activate
 # Install Python dependencies
 echo -e "${YELLOW}Installing Python dependencies...${NC}"
 pip install --upgrade pip
-pip install Flask==2.3.3 requests==2.31.0
+pip install Flask==2.3.3 requests==2.31.0 orjson==3.10.18 waitress==3.0.2
 
 # Copy files to the server directory
 echo -e "${YELLOW}Setting up server files...${NC}"
@@ -4,17 +4,22 @@ Raspberry Pi Order Notification Server
 Receives HTTP notifications from Firebase Cloud Functions when orders are placed
 """
 
+import functools
+import hashlib
+import hmac
 import json
 import logging
 import subprocess
 import sys
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+import orjson
 import os
+import queue
 import signal
 import threading
 import time
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Firebase Admin SDK for sending messages back to app
 try:
@@ -26,13 +31,21 @@ except ImportError:
     print("Firebase Admin SDK not available - Pi-to-App communication disabled")
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+LOG_LEVEL = logging.getLevelName(os.environ.get('LOG_LEVEL', 'WARNING').upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.WARNING  # unknown names fall back instead of crashing at startup
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Order payloads are small; reject oversized bodies before they are read or parsed
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024
 
 # Get API key from environment variable or use default for development
 API_KEY = os.environ.get('API_KEY', 'your-secure-api-key-here')
+_API_KEY_HASH = hashlib.sha256(API_KEY.encode()).digest()
+# Shorter bearer tokens are rejected before hashing (never above the real key length)
+MIN_KEY_LEN = min(16, len(API_KEY))
 
 # Get port from environment variable (Railway sets this)
 PORT = int(os.environ.get('PORT', 3000))
@@ -46,7 +59,8 @@ if FIREBASE_AVAILABLE:
         if service_account_info:
             cred = credentials.Certificate(json.loads(service_account_info))
             firebase_app = firebase_admin.initialize_app(cred, {
-                'databaseURL': os.environ.get('FIREBASE_DATABASE_URL')
+                'databaseURL': os.environ.get('FIREBASE_DATABASE_URL'),
+                'httpTimeout': 5
             })
             logger.info("Firebase Admin SDK initialized successfully")
         else:
@@ -55,26 +69,66 @@ if FIREBASE_AVAILABLE:
         logger.error(f"Failed to initialize Firebase Admin SDK: {e}")
         FIREBASE_AVAILABLE = False
 
-# Rate limiting
-request_counts = defaultdict(list)
+# Orders are brewed on background threads so requests return immediately
+_brew_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='brew')
+
+# Rate limiting (two-bucket sliding window in a fixed-size slot table)
 MAX_REQUESTS_PER_MINUTE = 10
+RATE_LIMIT_SLOTS = 4096  # power of two; memory stays constant however many IPs appear
+# slot -> (ip_address, window_index, current_window_count, previous_window_count)
+# An IP hashing onto a slot owned by another IP resets it, which can only
+# under-count occasionally - acceptable for a soft limiter.
+request_counts = [None] * RATE_LIMIT_SLOTS
+# Striped locks so concurrent requests for the same slot can't lose updates
+RATE_LOCK_STRIPES = 16
+_rate_locks = [threading.Lock() for _ in range(RATE_LOCK_STRIPES)]
 
 def is_rate_limited(ip_address):
     """Check if IP is rate limited"""
-    now = datetime.now()
-    minute_ago = now - timedelta(minutes=1)
-    
-    # Clean old requests
-    request_counts[ip_address] = [req_time for req_time in request_counts[ip_address] 
-                                 if req_time > minute_ago]
+    now = int(time.time())
+    window = now // 60
+    slot = hash(ip_address) & (RATE_LIMIT_SLOTS - 1)
     
-    # Check if too many requests
-    if len(request_counts[ip_address]) >= MAX_REQUESTS_PER_MINUTE:
-        return True
-    
-    # Add current request
-    request_counts[ip_address].append(now)
-    return False
+    with _rate_locks[slot & (RATE_LOCK_STRIPES - 1)]:
+        entry = request_counts[slot]
+        if entry is None or entry[0] != ip_address:
+            current, previous = 1, 0
+        elif entry[1] == window:
+            current, previous = entry[2] + 1, entry[3]
+        elif entry[1] == window - 1:
+            current, previous = 1, entry[2]
+        else:
+            current, previous = 1, 0
+        
+        # Weight the previous minute by how much of it still overlaps the window
+        weighted = previous * (1 - (now % 60) / 60) + current
+        if weighted > MAX_REQUESTS_PER_MINUTE:
+            return True
+        
+        request_counts[slot] = (ip_address, window, current, previous)
+        return False
+
+@functools.lru_cache(maxsize=1024)
+def _key_ok(token_hash):
+    """Constant-time comparison of a token digest against the API key digest"""
+    return hmac.compare_digest(token_hash, _API_KEY_HASH)
+
+def is_valid_api_key(token):
+    """Check a bearer token against the configured API key"""
+    return _key_ok(hashlib.sha256(token.encode()).digest())
+
+# (second, formatted timestamp) of the last _iso_now() call
+_ts_cache = (0, '')
+
+def _iso_now():
+    """Return the current UTC time as ISO 8601, formatted at most once per second"""
+    global _ts_cache
+    sec = int(time.time())
+    cached = _ts_cache
+    if cached[0] != sec:
+        cached = (sec, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(sec)))
+        _ts_cache = cached
+    return cached[1]
 
 def verify_firebase_ip(request):
     """Verify request comes from Firebase (optional additional security)"""
@@ -88,81 +142,195 @@ def verify_firebase_ip(request):
     
     # For now, we'll just log the IP for monitoring
     client_ip = request.remote_addr
-    logger.info(f"Request from IP: {client_ip}")
+    logger.info("Request from IP: %s", client_ip)
     
     return True  # Allow all for now, but you can restrict to Firebase IPs
 
-def send_status_to_app(user_id, order_id, status, message):
-    """Send status update back to the app via Firebase"""
+def _json(data, status=200):
+    """Serialize data with orjson into a JSON response"""
+    return app.response_class(orjson.dumps(data), status=status, mimetype='application/json')
+
+def _get_json():
+    """Parse the request body with orjson, returning None when it is empty"""
+    # Bodies over MAX_CONTENT_LENGTH raise RequestEntityTooLarge here
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        raise BadRequest('Invalid JSON data')
+
+@app.errorhandler(BadRequest)
+@app.errorhandler(RequestEntityTooLarge)
+def client_error(e):
+    """Report malformed or oversized request bodies as JSON client errors"""
+    logger.warning("Rejected request to %s from %s: %s", request.path, request.remote_addr, e.description)
+    return _json({'error': e.description}, e.code)
+
+def _error_response(body, status):
+    """Build an error response from a pre-encoded JSON body"""
+    return app.response_class(body, status=status, mimetype='application/json')
+
+# Rejection bodies are encoded once at import instead of on every request
+_RATE_LIMITED_BODY = orjson.dumps({'error': 'Rate limit exceeded'})
+_BAD_AUTH_HEADER_BODY = orjson.dumps({'error': 'Missing or invalid authorization header'})
+_BAD_API_KEY_BODY = orjson.dumps({'error': 'Invalid API key'})
+_BAD_SOURCE_BODY = orjson.dumps({'error': 'Unauthorized source'})
+
+# Static part of the health check response
+_HEALTH_BASE = {
+    'service': 'Order Notification Server',
+    'status': 'healthy',
+    'environment': os.environ.get('RAILWAY_ENVIRONMENT', 'development'),
+    'firebase_available': FIREBASE_AVAILABLE
+}
+
+def require_auth(rate_limit=True, check_firebase=True):
+    """Apply rate limiting, API key and source checks before the endpoint runs"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            client_ip = request.remote_addr
+            
+            # Rate limiting
+            if rate_limit and is_rate_limited(client_ip):
+                logger.warning("Rate limited request to %s from %s", request.path, client_ip)
+                return _error_response(_RATE_LIMITED_BODY, 429)
+            
+            # Verify API key
+            auth_header = request.headers.get('Authorization')
+            if not auth_header or not auth_header.startswith('Bearer '):
+                logger.warning("Invalid auth header for %s from %s", request.path, client_ip)
+                return _error_response(_BAD_AUTH_HEADER_BODY, 401)
+            
+            provided_key = auth_header[7:]
+            if len(provided_key) < MIN_KEY_LEN or not is_valid_api_key(provided_key):
+                logger.warning("Invalid API key for %s from %s", request.path, client_ip)
+                return _error_response(_BAD_API_KEY_BODY, 401)
+            
+            # Optional: Verify Firebase IP
+            if check_firebase and not verify_firebase_ip(request):
+                logger.warning("Request to %s from non-Firebase IP: %s", request.path, client_ip)
+                return _error_response(_BAD_SOURCE_BODY, 403)
+            
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Status writes are handed to a single background writer through a bounded
+# queue so a slow or unreachable Firebase can't stall request threads
+STATUS_QUEUE_SIZE = 256
+_status_q = queue.Queue(maxsize=STATUS_QUEUE_SIZE)
+
+def _collapse_status_batch(batch):
+    """Fold queued (path, status_data, merge) writes into one multi-location update"""
+    updates = {}
+    for path, status_data, merge in batch:
+        if not merge:
+            # A full write replaces anything queued earlier for the same node
+            prefix = path + '/'
+            updates = {key: value for key, value in updates.items()
+                       if key != path and not key.startswith(prefix)}
+            updates[path] = status_data
+        elif path in updates:
+            updates[path] = {**updates[path], **status_data}
+        else:
+            for key, value in status_data.items():
+                updates[f'{path}/{key}'] = value
+    return updates
+
+def _status_worker():
+    """Write queued status updates to Firebase Realtime Database"""
+    while True:
+        # Everything queued behind the current write goes out in the same request,
+        # latest update per node wins
+        batch = [_status_q.get()]
+        while True:
+            try:
+                batch.append(_status_q.get_nowait())
+            except queue.Empty:
+                break
+        
+        try:
+            updates = _collapse_status_batch(batch)
+            db.reference('/').update(updates)
+            
+            for path, status_data, merge in batch:
+                logger.info("Status sent to app: %s - %s (%s)", status_data['status'], status_data['message'], path)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Status update: %r", updates)
+            
+        except Exception as e:
+            logger.error("Failed to send status to app: %s", e)
+            logger.error("Error details: %s: %s", type(e).__name__, e)
+
+def send_status_to_app(user_id, order_id, status, message, history=None, merge=False):
+    """Queue a status update to be sent back to the app via Firebase
+    
+    Returns True once the update is queued; failures writing it to Firebase
+    are only logged by the status writer thread.
+    
+    By default the update replaces the order's status node; with merge=True
+    only the given fields are written and other children (e.g. history) are kept.
+    """
     if not FIREBASE_AVAILABLE or not firebase_app:
         logger.warning("Firebase not available - cannot send status to app")
         return False
     
+    # Create status update
+    status_data = {
+        'orderId': order_id,
+        'status': status,
+        'message': message,
+        'timestamp': _iso_now(),
+        'source': 'coffee-server'
+    }
+    if history is not None:
+        status_data['history'] = list(history)
+    item = (f'order_status/{user_id}/{order_id}', status_data, merge)
+    
     try:
-        # Create status update
-        status_data = {
-            'orderId': order_id,
-            'status': status,
-            'message': message,
-            'timestamp': datetime.now().isoformat(),
-            'source': 'coffee-server'
-        }
-        
-        # Send to Firebase Realtime Database
-        ref = db.reference(f'order_status/{user_id}/{order_id}')
-        ref.set(status_data)
-        
-        logger.info(f"Status sent to app: {status} - {message}")
-        logger.info(f"Database path: order_status/{user_id}/{order_id}")
-        logger.info(f"Status data: {status_data}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send status to app: {e}")
-        logger.error(f"Error details: {type(e).__name__}: {str(e)}")
-        return False
+        _status_q.put_nowait(item)
+    except queue.Full:
+        # Status updates are latest-wins, so make room by dropping the oldest
+        logger.warning("Status queue full - dropping oldest status update")
+        try:
+            _status_q.get_nowait()
+            _status_q.put_nowait(item)
+        except (queue.Empty, queue.Full):
+            logger.error("Failed to queue status for order %s", order_id)
+            return False
+    return True
+
+if FIREBASE_AVAILABLE and firebase_app:
+    threading.Thread(target=_status_worker, name='status-writer', daemon=True).start()
+
+# (timestamp, encoded body) of the last health check response
+_health_cache = ('', b'')
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'service': 'Order Notification Server',
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'environment': os.environ.get('RAILWAY_ENVIRONMENT', 'development'),
-        'firebase_available': FIREBASE_AVAILABLE
-    })
+    global _health_cache
+    timestamp = _iso_now()
+    cached = _health_cache
+    if cached[0] != timestamp:
+        cached = (timestamp, orjson.dumps({**_HEALTH_BASE, 'timestamp': timestamp}))
+        _health_cache = cached
+    return app.response_class(cached[1], mimetype='application/json')
 
 @app.route('/order-notification', methods=['POST'])
+@require_auth()
 def order_notification():
     """Handle order notifications from Firebase"""
-    # Rate limiting
-    if is_rate_limited(request.remote_addr):
-        logger.warning(f"Rate limited request from {request.remote_addr}")
-        return jsonify({'error': 'Rate limit exceeded'}), 429
-    
-    # Verify API key
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        logger.warning(f"Invalid auth header from {request.remote_addr}")
-        return jsonify({'error': 'Missing or invalid authorization header'}), 401
-    
-    provided_key = auth_header.split(' ')[1]
-    if provided_key != API_KEY:
-        logger.warning(f"Invalid API key from {request.remote_addr}")
-        return jsonify({'error': 'Invalid API key'}), 401
-    
-    # Optional: Verify Firebase IP
-    if not verify_firebase_ip(request):
-        logger.warning(f"Request from non-Firebase IP: {request.remote_addr}")
-        return jsonify({'error': 'Unauthorized source'}), 403
-    
     try:
-        data = request.get_json()
+        data = _get_json()
         if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+            return _json({'error': 'No JSON data provided'}, 400)
         
-        logger.info(f"Received order notification from {request.remote_addr}: {data}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received order notification from %s: %r", request.remote_addr, data)
         
         # Extract order information
         user_id = data.get('userId', 'unknown')
@@ -172,55 +340,40 @@ def order_notification():
         total_value = data.get('totalValue', 0)
         
         # Log the order details
-        logger.info(f"Order from user {user_id}: {order_count} items, total: ${total_value}")
-        
-        # Send "preparing" status to app
-        send_status_to_app(user_id, order_id, "preparing", "Order received, starting preparation")
+        logger.info("Order from user %s: %s items, total: $%s", user_id, order_count, total_value)
         
-        # Trigger coffee machine (placeholder function)
-        trigger_coffee_machine(orders, user_id, order_id)
+        # Trigger coffee machine in the background (placeholder function)
+        _brew_pool.submit(trigger_coffee_machine, orders, user_id, order_id)
         
-        # Send notification (placeholder function)
-        send_notification(user_id, orders, total_value)
+        # Send notification in the background (placeholder function)
+        _brew_pool.submit(send_notification, user_id, orders, total_value)
         
-        return jsonify({
-            'message': 'Order notification received and processed',
+        return _json({
+            'message': 'Order notification received and queued for processing',
             'status': 'success',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': _iso_now(),
             'order_count': order_count,
             'total_value': total_value,
             'order_id': order_id
-        })
+        }, 202)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing order notification: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error processing order notification: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
 
 @app.route('/submit-number', methods=['POST'])
+@require_auth(check_firebase=False)
 def submit_number():
     """Handle order number submission from app"""
-    # Rate limiting
-    if is_rate_limited(request.remote_addr):
-        logger.warning(f"Rate limited number submission from {request.remote_addr}")
-        return jsonify({'error': 'Rate limit exceeded'}), 429
-    
-    # Verify API key
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        logger.warning(f"Invalid auth header in number submission from {request.remote_addr}")
-        return jsonify({'error': 'Missing or invalid authorization header'}), 401
-    
-    provided_key = auth_header.split(' ')[1]
-    if provided_key != API_KEY:
-        logger.warning(f"Invalid API key in number submission from {request.remote_addr}")
-        return jsonify({'error': 'Invalid API key'}), 401
-    
     try:
-        data = request.get_json()
+        data = _get_json()
         if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+            return _json({'error': 'No JSON data provided'}, 400)
         
-        logger.info(f"Number submission received from {request.remote_addr}: {data}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Number submission received from %s: %r", request.remote_addr, data)
         
         # Extract data
         user_id = data.get('userId', 'unknown')
@@ -228,7 +381,7 @@ def submit_number():
         number = data.get('number', 'unknown')
         
         # Log the number submission
-        logger.info(f"Order number submitted by user {user_id} for order {order_id}: {number}")
+        logger.info("Order number submitted by user %s for order %s: %s", user_id, order_id, number)
         
         # Here you would typically:
         # 1. Display the number on a screen
@@ -237,117 +390,114 @@ def submit_number():
         # 4. Send confirmation back to app
         
         # For now, we'll just log it and send a confirmation
-        logger.info(f"Number {number} displayed for order {order_id}")
+        logger.info("Number %s displayed for order %s", number, order_id)
         
         # Send confirmation status to app
-        send_status_to_app(user_id, order_id, "completed", f"Order completed! Number {number} displayed.")
+        # Merge so the brewing history written by trigger_coffee_machine is kept
+        send_status_to_app(user_id, order_id, "completed", f"Order completed! Number {number} displayed.", merge=True)
         
-        return jsonify({
+        return _json({
             'message': 'Order number received and displayed',
             'status': 'success',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': _iso_now(),
             'order_id': order_id,
             'number': number,
             'user_id': user_id
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing number submission: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error processing number submission: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
 
 @app.route('/test', methods=['POST'])
+@require_auth()
 def test_endpoint():
     """Test endpoint for Firebase connection testing"""
-    # Rate limiting
-    if is_rate_limited(request.remote_addr):
-        logger.warning(f"Rate limited test request from {request.remote_addr}")
-        return jsonify({'error': 'Rate limit exceeded'}), 429
-    
-    # Verify API key
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        logger.warning(f"Invalid auth header in test from {request.remote_addr}")
-        return jsonify({'error': 'Missing or invalid authorization header'}), 401
-    
-    provided_key = auth_header.split(' ')[1]
-    if provided_key != API_KEY:
-        logger.warning(f"Invalid API key in test from {request.remote_addr}")
-        return jsonify({'error': 'Invalid API key'}), 401
-    
-    # Optional: Verify Firebase IP
-    if not verify_firebase_ip(request):
-        logger.warning(f"Test request from non-Firebase IP: {request.remote_addr}")
-        return jsonify({'error': 'Unauthorized source'}), 403
-    
     try:
-        data = request.get_json()
-        logger.info(f"Test request received from {request.remote_addr}: {data}")
+        data = _get_json()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Test request received from %s: %r", request.remote_addr, data)
         
         # Test sending a message back to app if Firebase is available
         if FIREBASE_AVAILABLE and data and 'userId' in data:
             send_status_to_app(data['userId'], 'test_order', 'test', 'Test message from Railway server')
         
-        return jsonify({
+        return _json({
             'message': 'Raspberry Pi is online and responding',
             'status': 'success',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': _iso_now(),
             'received_data': data,
             'firebase_available': FIREBASE_AVAILABLE
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in test endpoint: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error in test endpoint: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
 
 @app.route('/status/<user_id>/<order_id>', methods=['POST'])
+@require_auth(rate_limit=False, check_firebase=False)
 def update_order_status(user_id, order_id):
-    """Update order status (for manual updates or coffee machine integration)"""
-    # Verify API key
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({'error': 'Missing or invalid authorization header'}), 401
-    
-    provided_key = auth_header.split(' ')[1]
-    if provided_key != API_KEY:
-        return jsonify({'error': 'Invalid API key'}), 401
+    """Update order status (for manual updates or coffee machine integration)
     
+    The write to Firebase happens in the background, so 'queued' only reports
+    whether the update was accepted for sending, not whether Firebase stored it.
+    """
     try:
-        data = request.get_json()
+        data = _get_json()
         status = data.get('status', 'unknown')
         message = data.get('message', 'Status updated')
         
-        # Send status to app
-        success = send_status_to_app(user_id, order_id, status, message)
+        # Queue status for the app
+        queued = send_status_to_app(user_id, order_id, status, message)
         
-        return jsonify({
-            'success': success,
-            'message': f'Status updated to: {status}',
-            'timestamp': datetime.now().isoformat()
+        return _json({
+            'queued': queued,
+            'message': f'Status update queued: {status}',
+            'timestamp': _iso_now()
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error updating order status: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error updating order status: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
 
 def trigger_coffee_machine(orders, user_id, order_id):
     """Trigger the coffee machine to make the ordered drinks"""
+    # Transitions are collected locally and attached once to the final write
+    status_log = []
+    
+    def record(status, message):
+        status_log.append({'status': status, 'message': message, 'timestamp': _iso_now()})
+    
     try:
-        logger.info(f"Triggering coffee machine for {len(orders)} orders")
+        # Send "preparing" status to app
+        record("preparing", "Order received, starting preparation")
+        send_status_to_app(user_id, order_id, "preparing", "Order received, starting preparation")
+        
+        logger.info("Triggering coffee machine for %d orders", len(orders))
         
         # Send "brewing" status to app
+        record("brewing", "Coffee machine started")
         send_status_to_app(user_id, order_id, "brewing", "Coffee machine started")
         
         # This is where you would integrate with your actual coffee machine
         # For now, we'll just log the action and simulate brewing time
         
         for i, order in enumerate(orders):
-            logger.info(f"Making drink {i+1}: {order.get('name', 'Unknown drink')}")
+            logger.info("Making drink %d: %s", i + 1, order.get('name', 'Unknown drink'))
             
             # Simulate brewing time (remove this in production)
             time.sleep(2)
             
             # Send progress update
-            send_status_to_app(user_id, order_id, "brewing", f"Making drink {i+1} of {len(orders)}")
+            progress = f"Making drink {i+1} of {len(orders)}"
+            record("brewing", progress)
+            send_status_to_app(user_id, order_id, "brewing", progress)
             
             # Example: You could send commands to GPIO pins here
             # import RPi.GPIO as GPIO
@@ -358,29 +508,30 @@ def trigger_coffee_machine(orders, user_id, order_id):
             # GPIO.output(18, GPIO.LOW)
         
         # Send "ready" status to app
-        send_status_to_app(user_id, order_id, "ready", "Order completed and ready for pickup")
+        record("ready", "Order completed and ready for pickup")
+        send_status_to_app(user_id, order_id, "ready", "Order completed and ready for pickup", status_log, merge=True)
         
         logger.info("Coffee machine trigger completed")
         
     except Exception as e:
-        logger.error(f"Error triggering coffee machine: {str(e)}")
+        logger.error("Error triggering coffee machine: %s", e)
         # Send error status to app
-        send_status_to_app(user_id, order_id, "error", f"Error: {str(e)}")
+        record("error", f"Error: {str(e)}")
+        send_status_to_app(user_id, order_id, "error", f"Error: {str(e)}", status_log, merge=True)
 
 def send_notification(user_id, orders, total_value):
     """Send notification about the order"""
     try:
-        logger.info(f"Sending notification to user {user_id}")
+        logger.info("Sending notification to user %s", user_id)
         
         # This is where you would integrate with notification services
         # Examples: Email, SMS, Push notifications, etc.
         
         # For now, we'll just log the notification
-        notification_text = f"Order received: {len(orders)} items, total: ${total_value}"
-        logger.info(f"Notification: {notification_text}")
+        logger.info("Notification: Order received: %d items, total: $%s", len(orders), total_value)
         
     except Exception as e:
-        logger.error(f"Error sending notification: {str(e)}")
+        logger.error("Error sending notification: %s", e)
 
 if __name__ == '__main__':
     logger.info(f"Starting Order Notification Server on port {PORT}")
@@ -388,5 +539,6 @@ if __name__ == '__main__':
     logger.info(f"Rate limiting: {MAX_REQUESTS_PER_MINUTE} requests per minute per IP")
     logger.info(f"Firebase Admin SDK: {'Available' if FIREBASE_AVAILABLE else 'Not available'}")
     
-    # Run the Flask app
-    app.run(host='0.0.0.0', port=PORT, debug=False) 
\ No newline at end of file
+    # Serve with waitress: Werkzeug's dev server handles one request at a time
+    from waitress import serve
+    serve(app, host='0.0.0.0', port=PORT, threads=8, connection_limit=200, channel_timeout=30) 
\ No newline at end of file
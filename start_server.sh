@@ -21,10 +21,10 @@ fi
 log "Activating virtual environment..."
 source venv/bin/activate
 
-# Check if Flask is installed
-if ! python -c "import flask" 2>/dev/null; then
-    log "ERROR: Flask not found. Installing dependencies..."
-    pip install Flask==2.3.3 requests==2.31.0
+# Check if dependencies are installed
+if ! python -c "import flask, orjson, waitress" 2>/dev/null; then
+    log "ERROR: Python dependencies not found. Installing dependencies..."
+    pip install Flask==2.3.3 requests==2.31.0 orjson==3.10.18 waitress==3.0.2
 fi
 
 # Start the server